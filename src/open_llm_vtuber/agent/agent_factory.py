@@ -1,19 +1,381 @@
-from typing import Type, Literal
+import sys
+from typing import TYPE_CHECKING, Any, Type, Literal
 from loguru import logger
 import importlib  # 新增
 
 from .agents.agent_interface import AgentInterface
-from .agents.basic_memory_agent import BasicMemoryAgent
+from .output_types import register_output_type
 from .stateless_llm_factory import (
     LLMFactory as StatelessLLMFactory,
 )
-from .agents.hume_ai import HumeAIAgent
-from .agents.letta_agent import LettaAgent
-
-from ..mcpp.tool_manager import ToolManager
-from ..mcpp.tool_executor import ToolExecutor
 from typing import Optional
 
+# 具体 Agent 实现在各自的构建函数中按需导入，避免启动时加载用不到的 SDK
+if TYPE_CHECKING:
+    from ..mcpp.tool_manager import ToolManager
+    from ..mcpp.tool_executor import ToolExecutor
+
+
+# 自定义 Agent 类缓存："module.path.ClassName" -> class
+_AGENT_CLASS_CACHE: dict[str, type] = {}
+
+
+def _resolve_agent_class(dotted: str) -> type:
+    """Resolve a dotted "module.path.ClassName" to a class, caching the result.
+
+    Raises:
+        ValueError: If the path has no module part
+        ImportError: If the module cannot be imported
+        AttributeError: If the module has no such class
+    """
+    cls = _AGENT_CLASS_CACHE.get(dotted)
+    if cls is not None:
+        return cls
+    module_path, class_name = dotted.rsplit(".", 1)
+    modules = sys.modules
+    module = modules.get(module_path)
+    if module is None:
+        module = importlib.import_module(module_path)
+    cls = getattr(module, class_name)
+    _AGENT_CLASS_CACHE[dotted] = cls
+    return cls
+
+
+# 自定义 Agent 中由工厂负责传入的参数名，不会作为额外关键字参数转发
+_RESERVED_CUSTOM_KEYS = frozenset(
+    {
+        "llm",
+        "system",
+        "live2d_model",
+        "tts_preprocessor_config",
+        "tool_prompts",
+        "tool_manager",
+        "tool_executor",
+        "mcp_prompt_string",
+        "interrupt_method",
+        "faster_first_response",
+        "segment_method",
+        "use_mcpp",
+        "llm_provider",
+    }
+)
+
+
+def _as_dict(obj: Any) -> Any:
+    """Return obj.model_dump() for Pydantic models, else obj unchanged."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return obj
+
+
+def _build_basic_memory(
+    agent_settings: dict,
+    llm_configs: dict,
+    system_prompt: str,
+    live2d_model=None,
+    tts_preprocessor_config=None,
+    **kwargs,
+) -> AgentInterface:
+    """Build a BasicMemoryAgent backed by a stateless LLM."""
+    # Get the LLM provider choice from agent settings
+    basic_memory_settings: dict = (
+        agent_settings.get("basic_memory_agent", {})
+    )
+    llm_provider: str = basic_memory_settings.get(
+        "llm_provider"
+    )
+
+    if not llm_provider:
+        raise ValueError(
+            "LLM provider not specified for basic memory agent"
+        )
+
+    # Get the LLM config for this provider
+    llm_config: dict = llm_configs.get(llm_provider)
+    # 🔧 修复：先检查 llm_config 是否为 None
+    if llm_config is None:
+        raise ValueError(
+            f"Configuration not found for LLM provider: {llm_provider}"
+        )
+
+    interrupt_method: Literal["system", "user"] = (
+        llm_config.pop("interrupt_method", "user")
+    )
+
+    # 原来的 if not llm_config: 检查可以保留，但此时 llm_config 已经不为 None
+    # 可选：如果 llm_config 在 pop 后变为空，是否需要处理？通常不需要，因为后面还会传给 create_llm
+    # 但保留原有逻辑也无妨
+    if not llm_config:
+        logger.warning(
+            f"LLM config for {llm_provider} is empty after pop"
+        )
+
+    # Create the stateless LLM
+    llm = StatelessLLMFactory.create_llm(
+        llm_provider=llm_provider,
+        system_prompt=system_prompt,
+        **llm_config,
+    )
+
+    tool_prompts = kwargs.get(
+        "system_config", {}
+    ).get("tool_prompts", {})
+
+    # Extract MCP components/data needed by BasicMemoryAgent from kwargs
+    tool_manager: Optional["ToolManager"] = (
+        kwargs.get("tool_manager")
+    )
+    tool_executor: Optional["ToolExecutor"] = (
+        kwargs.get("tool_executor")
+    )
+    mcp_prompt_string: str = kwargs.get(
+        "mcp_prompt_string", ""
+    )
+
+    from .agents.basic_memory_agent import (
+        BasicMemoryAgent,
+    )
+
+    # Create the agent with the LLM and live2d_model
+    return BasicMemoryAgent(
+        llm=llm,
+        system=system_prompt,
+        live2d_model=live2d_model,
+        tts_preprocessor_config=tts_preprocessor_config,
+        faster_first_response=basic_memory_settings.get(
+            "faster_first_response", True
+        ),
+        segment_method=basic_memory_settings.get(
+            "segment_method", "pysbd"
+        ),
+        use_mcpp=basic_memory_settings.get(
+            "use_mcpp", False
+        ),
+        interrupt_method=interrupt_method,
+        tool_prompts=tool_prompts,
+        tool_manager=tool_manager,
+        tool_executor=tool_executor,
+        mcp_prompt_string=mcp_prompt_string,
+    )
+
+
+def _build_mem0(
+    agent_settings: dict,
+    llm_configs: dict,
+    system_prompt: str,
+    live2d_model=None,
+    tts_preprocessor_config=None,
+    **kwargs,
+) -> AgentInterface:
+    """mem0_agent is deprecated; always raises."""
+    logger.critical(
+        "mem0_agent is deprecated and no longer supported. Please switch to basic_memory_agent or a custom agent implementation."
+    )
+    raise NotImplementedError(
+        "mem0_agent is deprecated and no longer supported."
+    )
+
+
+def _build_hume(
+    agent_settings: dict,
+    llm_configs: dict,
+    system_prompt: str,
+    live2d_model=None,
+    tts_preprocessor_config=None,
+    **kwargs,
+) -> AgentInterface:
+    """Build a HumeAIAgent."""
+    from .agents.hume_ai import HumeAIAgent
+
+    settings = agent_settings.get(
+        "hume_ai_agent", {}
+    )
+    return HumeAIAgent(
+        api_key=settings.get("api_key"),
+        host=settings.get("host", "api.hume.ai"),
+        config_id=settings.get("config_id"),
+        idle_timeout=settings.get(
+            "idle_timeout", 15
+        ),
+    )
+
+
+def _build_letta(
+    agent_settings: dict,
+    llm_configs: dict,
+    system_prompt: str,
+    live2d_model=None,
+    tts_preprocessor_config=None,
+    **kwargs,
+) -> AgentInterface:
+    """Build a LettaAgent."""
+    from .agents.letta_agent import LettaAgent
+
+    settings = agent_settings.get("letta_agent", {})
+    return LettaAgent(
+        live2d_model=live2d_model,
+        id=settings.get("id"),
+        tts_preprocessor_config=tts_preprocessor_config,
+        faster_first_response=settings.get(
+            "faster_first_response"
+        ),
+        segment_method=settings.get(
+            "segment_method"
+        ),
+        host=settings.get("host"),
+        port=settings.get("port"),
+    )
+
+
+def _build_custom(
+    conversation_agent_choice: str,
+    agent_settings: dict,
+    llm_configs: dict,
+    system_prompt: str,
+    live2d_model=None,
+    tts_preprocessor_config=None,
+    **kwargs,
+) -> AgentInterface:
+    """Load and build a custom agent from a "module.path.ClassName" choice."""
+    # ========== 动态导入自定义 Agent ==========
+    try:
+        agent_class = _resolve_agent_class(
+            conversation_agent_choice
+        )
+        logger.info(
+            f"Dynamically loading custom agent: {agent_class} from {agent_class.__module__}"
+        )
+    except (
+        ImportError,
+        AttributeError,
+        ValueError,
+    ) as e:
+        logger.error(
+            f"Failed to load custom agent '{conversation_agent_choice}': {e}"
+        )
+        raise ValueError(
+            f"Unsupported agent type or failed to load custom agent: {conversation_agent_choice}"
+        )
+
+    # 注册自定义输出类型为 SentenceOutput / AudioOutput 的虚拟子类，
+    # 格式为 {SentenceOutput: (MyOutput, ...), AudioOutput: (...)}
+    output_types = getattr(agent_class, "output_types", {})
+    if not isinstance(output_types, dict):
+        logger.warning(
+            f"{agent_class.__name__}.output_types should map SentenceOutput/AudioOutput "
+            "to output classes; ignoring it"
+        )
+        output_types = {}
+    for base, classes in output_types.items():
+        for output_type in classes:
+            try:
+                register_output_type(output_type, base)
+            except TypeError as e:
+                logger.warning(f"Skipping output type: {e}")
+
+    # 🔧 将 agent_settings 转为字典（兼容 Pydantic 模型）
+    agent_settings_dict = _as_dict(agent_settings)
+
+    custom_settings = agent_settings_dict.get(
+        conversation_agent_choice, {}
+    )
+    logger.debug(
+        f"Custom settings for {conversation_agent_choice}: {custom_settings}"
+    )
+
+    # 强制要求 llm_provider
+    llm_provider = custom_settings.get(
+        "llm_provider"
+    )
+    if not llm_provider:
+        raise ValueError(
+            f"Custom agent '{conversation_agent_choice}' requires 'llm_provider' in its settings."
+        )
+
+    # 🔧 将 llm_configs 转为字典
+    llm_configs_dict = _as_dict(llm_configs)
+
+    llm_config = llm_configs_dict.get(llm_provider)
+    if llm_config is None:
+        raise ValueError(
+            f"Configuration not found for LLM provider: {llm_provider}"
+        )
+
+    # 取出 interrupt_method（如果存在）；不修改可能被缓存共享的字典
+    interrupt_method = llm_config.get(
+        "interrupt_method", "user"
+    )
+    llm_config = {
+        k: v
+        for k, v in llm_config.items()
+        if k != "interrupt_method"
+    }
+
+    # 创建 LLM 实例
+    llm = StatelessLLMFactory.create_llm(
+        llm_provider=llm_provider,
+        system_prompt=system_prompt,
+        **llm_config,
+    )
+
+    # 构建基础参数
+    base_args = {
+        "llm": llm,
+        "system": system_prompt,
+        "live2d_model": live2d_model,
+        "tts_preprocessor_config": tts_preprocessor_config,
+        "tool_prompts": kwargs.get(
+            "system_config", {}
+        ).get("tool_prompts", {}),
+        "tool_manager": kwargs.get("tool_manager"),
+        "tool_executor": kwargs.get(
+            "tool_executor"
+        ),
+        "mcp_prompt_string": kwargs.get(
+            "mcp_prompt_string", ""
+        ),
+        "interrupt_method": interrupt_method,
+    }
+
+    # 添加 BasicMemoryAgent 风格的额外参数
+    for key in [
+        "faster_first_response",
+        "segment_method",
+        "use_mcpp",
+    ]:
+        if key in custom_settings:
+            base_args[key] = custom_settings[key]
+
+    # 剩余的自定义设置作为额外关键字参数
+    extra_kwargs = {
+        k: v
+        for k, v in custom_settings.items()
+        if k not in _RESERVED_CUSTOM_KEYS
+    }
+
+    try:
+        agent = agent_class(
+            **base_args, **extra_kwargs
+        )
+        logger.info(
+            f"Successfully instantiated custom agent: {conversation_agent_choice}"
+        )
+        return agent
+    except Exception as e:
+        logger.error(
+            f"Failed to instantiate custom agent '{conversation_agent_choice}': {e}"
+        )
+        raise
+
+
+# 内置 Agent 的构建函数；未命中的名称按 "module.path.ClassName" 动态加载
+_BUILDERS = {
+    "basic_memory_agent": _build_basic_memory,
+    "mem0_agent": _build_mem0,
+    "hume_ai_agent": _build_hume,
+    "letta_agent": _build_letta,
+}
+
 
 class AgentFactory:
     @staticmethod
@@ -41,246 +403,22 @@ class AgentFactory:
             f"Initializing agent: {conversation_agent_choice}"
         )
 
-        if (
-            conversation_agent_choice
-            == "basic_memory_agent"
-        ):
-            # Get the LLM provider choice from agent settings
-            basic_memory_settings: dict = (
-                agent_settings.get("basic_memory_agent", {})
-            )
-            llm_provider: str = basic_memory_settings.get(
-                "llm_provider"
-            )
-
-            if not llm_provider:
-                raise ValueError(
-                    "LLM provider not specified for basic memory agent"
-                )
-
-            # Get the LLM config for this provider
-            llm_config: dict = llm_configs.get(llm_provider)
-            # 🔧 修复：先检查 llm_config 是否为 None
-            if llm_config is None:
-                raise ValueError(
-                    f"Configuration not found for LLM provider: {llm_provider}"
-                )
-
-            interrupt_method: Literal["system", "user"] = (
-                llm_config.pop("interrupt_method", "user")
-            )
-
-            # 原来的 if not llm_config: 检查可以保留，但此时 llm_config 已经不为 None
-            # 可选：如果 llm_config 在 pop 后变为空，是否需要处理？通常不需要，因为后面还会传给 create_llm
-            # 但保留原有逻辑也无妨
-            if not llm_config:
-                logger.warning(
-                    f"LLM config for {llm_provider} is empty after pop"
-                )
-
-            # Create the stateless LLM
-            llm = StatelessLLMFactory.create_llm(
-                llm_provider=llm_provider,
-                system_prompt=system_prompt,
-                **llm_config,
-            )
-
-            tool_prompts = kwargs.get(
-                "system_config", {}
-            ).get("tool_prompts", {})
-
-            # Extract MCP components/data needed by BasicMemoryAgent from kwargs
-            tool_manager: Optional[ToolManager] = (
-                kwargs.get("tool_manager")
-            )
-            tool_executor: Optional[ToolExecutor] = (
-                kwargs.get("tool_executor")
+        builder = _BUILDERS.get(conversation_agent_choice)
+        if builder is not None:
+            return builder(
+                agent_settings,
+                llm_configs,
+                system_prompt,
+                live2d_model,
+                tts_preprocessor_config,
+                **kwargs,
             )
-            mcp_prompt_string: str = kwargs.get(
-                "mcp_prompt_string", ""
-            )
-
-            # Create the agent with the LLM and live2d_model
-            return BasicMemoryAgent(
-                llm=llm,
-                system=system_prompt,
-                live2d_model=live2d_model,
-                tts_preprocessor_config=tts_preprocessor_config,
-                faster_first_response=basic_memory_settings.get(
-                    "faster_first_response", True
-                ),
-                segment_method=basic_memory_settings.get(
-                    "segment_method", "pysbd"
-                ),
-                use_mcpp=basic_memory_settings.get(
-                    "use_mcpp", False
-                ),
-                interrupt_method=interrupt_method,
-                tool_prompts=tool_prompts,
-                tool_manager=tool_manager,
-                tool_executor=tool_executor,
-                mcp_prompt_string=mcp_prompt_string,
-            )
-
-        elif conversation_agent_choice == "mem0_agent":
-            logger.critical(
-                "mem0_agent is deprecated and no longer supported. Please switch to basic_memory_agent or a custom agent implementation."
-            )
-            raise NotImplementedError(
-                "mem0_agent is deprecated and no longer supported."
-            )
-
-        elif conversation_agent_choice == "hume_ai_agent":
-            settings = agent_settings.get(
-                "hume_ai_agent", {}
-            )
-            return HumeAIAgent(
-                api_key=settings.get("api_key"),
-                host=settings.get("host", "api.hume.ai"),
-                config_id=settings.get("config_id"),
-                idle_timeout=settings.get(
-                    "idle_timeout", 15
-                ),
-            )
-
-        elif conversation_agent_choice == "letta_agent":
-            settings = agent_settings.get("letta_agent", {})
-            return LettaAgent(
-                live2d_model=live2d_model,
-                id=settings.get("id"),
-                tts_preprocessor_config=tts_preprocessor_config,
-                faster_first_response=settings.get(
-                    "faster_first_response"
-                ),
-                segment_method=settings.get(
-                    "segment_method"
-                ),
-                host=settings.get("host"),
-                port=settings.get("port"),
-            )
-
-        # 在 else 分支中
-        else:
-            # ========== 动态导入自定义 Agent ==========
-            try:
-                module_path, class_name = (
-                    conversation_agent_choice.rsplit(".", 1)
-                )
-                module = importlib.import_module(
-                    module_path
-                )
-                agent_class = getattr(module, class_name)
-                logger.info(
-                    f"Dynamically loading custom agent: {agent_class} from {module_path}"
-                )
-            except (
-                ImportError,
-                AttributeError,
-                ValueError,
-            ) as e:
-                logger.error(
-                    f"Failed to load custom agent '{conversation_agent_choice}': {e}"
-                )
-                raise ValueError(
-                    f"Unsupported agent type or failed to load custom agent: {conversation_agent_choice}"
-                )
-
-            # 🔧 将 agent_settings 转为字典（兼容 Pydantic 模型）
-            if hasattr(agent_settings, "model_dump"):
-                agent_settings_dict = (
-                    agent_settings.model_dump()
-                )
-            else:
-                agent_settings_dict = agent_settings
-
-            custom_settings = agent_settings_dict.get(
-                conversation_agent_choice, {}
-            )
-            logger.debug(
-                f"Custom settings for {conversation_agent_choice}: {custom_settings}"
-            )
-
-            # 强制要求 llm_provider
-            llm_provider = custom_settings.get(
-                "llm_provider"
-            )
-            if not llm_provider:
-                raise ValueError(
-                    f"Custom agent '{conversation_agent_choice}' requires 'llm_provider' in its settings."
-                )
-
-            # 🔧 将 llm_configs 转为字典
-            if hasattr(llm_configs, "model_dump"):
-                llm_configs_dict = llm_configs.model_dump()
-            else:
-                llm_configs_dict = llm_configs
-
-            llm_config = llm_configs_dict.get(llm_provider)
-            if llm_config is None:
-                raise ValueError(
-                    f"Configuration not found for LLM provider: {llm_provider}"
-                )
-
-            # 弹出 interrupt_method（如果存在）
-            interrupt_method = llm_config.pop(
-                "interrupt_method", "user"
-            )
-
-            # 创建 LLM 实例
-            llm = StatelessLLMFactory.create_llm(
-                llm_provider=llm_provider,
-                system_prompt=system_prompt,
-                **llm_config,
-            )
-
-            # 构建基础参数
-            base_args = {
-                "llm": llm,
-                "system": system_prompt,
-                "live2d_model": live2d_model,
-                "tts_preprocessor_config": tts_preprocessor_config,
-                "tool_prompts": kwargs.get(
-                    "system_config", {}
-                ).get("tool_prompts", {}),
-                "tool_manager": kwargs.get("tool_manager"),
-                "tool_executor": kwargs.get(
-                    "tool_executor"
-                ),
-                "mcp_prompt_string": kwargs.get(
-                    "mcp_prompt_string", ""
-                ),
-                "interrupt_method": interrupt_method,
-            }
-
-            # 添加 BasicMemoryAgent 风格的额外参数
-            for key in [
-                "faster_first_response",
-                "segment_method",
-                "use_mcpp",
-            ]:
-                if key in custom_settings:
-                    base_args[key] = custom_settings[key]
-
-            # 剩余的自定义设置作为额外关键字参数
-            reserved_keys = set(base_args.keys()) | {
-                "llm_provider"
-            }
-            extra_kwargs = {
-                k: v
-                for k, v in custom_settings.items()
-                if k not in reserved_keys
-            }
-
-            try:
-                agent = agent_class(
-                    **base_args, **extra_kwargs
-                )
-                logger.info(
-                    f"Successfully instantiated custom agent: {conversation_agent_choice}"
-                )
-                return agent
-            except Exception as e:
-                logger.error(
-                    f"Failed to instantiate custom agent '{conversation_agent_choice}': {e}"
-                )
-                raise
+        return _build_custom(
+            conversation_agent_choice,
+            agent_settings,
+            llm_configs,
+            system_prompt,
+            live2d_model,
+            tts_preprocessor_config,
+            **kwargs,
+        )
@@ -28,6 +28,14 @@ class AgentInterface(ABC):
         logger.critical("Agent: No chat function set.")
         raise ValueError("Agent: No chat function set.")
 
+    async def warmup(self) -> None:
+        """
+        Prepare the agent's backend ahead of a chat call, e.g. load the LLM into
+        memory while speech recognition is still running. Must not raise.
+        Does nothing by default.
+        """
+        return None
+
     @abstractmethod
     def handle_interrupt(self, heard_response: str) -> None:
         """
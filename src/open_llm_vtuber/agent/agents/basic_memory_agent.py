@@ -865,6 +865,10 @@ class BasicMemoryAgent(AgentInterface):
         async for output in chat_func_decorated(input_data):
             yield output
 
+    async def warmup(self) -> None:
+        """Warm up the underlying LLM."""
+        await self._llm.warmup()
+
     def reset_interrupt(self) -> None:
         """Reset interrupt flag."""
         self._interrupt_handled = False
@@ -75,3 +75,25 @@ class AudioOutput(BaseOutput):
     async def __aiter__(self):
         """Iterate through audio segments and their actions"""
         yield self.audio_path, self.display_text, self.transcript, self.actions
+
+
+def register_output_type(cls: type, base: type) -> type:
+    """
+    Register an output class as a virtual subclass of base, so isinstance
+    checks on the conversation hot path accept it.
+
+    Args:
+        cls: The agent's output class
+        base: SentenceOutput or AudioOutput
+
+    Raises:
+        TypeError: If base is not SentenceOutput or AudioOutput
+    """
+    if base not in (SentenceOutput, AudioOutput):
+        raise TypeError(
+            f"Cannot register {cls.__name__} as {getattr(base, '__name__', base)}; "
+            "expected SentenceOutput or AudioOutput"
+        )
+    if not issubclass(cls, base):
+        base.register(cls)
+    return cls
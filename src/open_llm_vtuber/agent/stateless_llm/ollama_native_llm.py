@@ -1,9 +1,69 @@
-import json
-import httpx, requests, asyncio
+import orjson
+import httpx
 from typing import AsyncIterator, List, Dict, Any, Optional
 from loguru import logger
 from .stateless_llm_interface import StatelessLLMInterface
 
+# 按 base_url 共享的 HTTP 客户端，所有实例复用同一个连接池
+_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+
+
+def _client_for(base_url: str) -> httpx.AsyncClient:
+    """Return the shared client for base_url, creating it if needed."""
+    client = _CLIENTS.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=60.0, http2=False)
+        _CLIENTS[base_url] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    """Close every shared client. Must run on the loop that used them."""
+    clients = list(_CLIENTS.values())
+    _CLIENTS.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def _normalize_messages(
+    messages: List[Dict[str, Any]], system: Optional[str]
+) -> List[Dict[str, Any]]:
+    """Shape messages for Ollama's /api/chat without mutating the input.
+
+    Multimodal list contents are flattened to their text parts; string
+    contents are passed through as-is.
+    """
+    processed_messages = (
+        [{"role": "system", "content": system}]
+        if system
+        else []
+    )
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, list):
+            text = " ".join(
+                part.get("text", "")
+                for part in content
+                if isinstance(part, dict)
+                and part.get("type") == "text"
+            )
+            processed_messages.append(
+                {**msg, "content": text}
+            )
+        else:
+            processed_messages.append(msg)
+    return processed_messages
+
+
+def _already_ollama_ready(
+    messages: List[Dict[str, Any]], system: Optional[str]
+) -> bool:
+    """True if messages can be sent as-is: no system prompt to prepend
+    and every content is already a plain string."""
+    return not system and all(
+        isinstance(msg.get("content"), str) for msg in messages
+    )
+
 
 class OllamaNativeLLM(StatelessLLMInterface):
     def __init__(
@@ -19,44 +79,27 @@ class OllamaNativeLLM(StatelessLLMInterface):
         self.base_url = base_url.rstrip("/")
         self.temperature = temperature
         self.keep_alive = keep_alive
-        self.client = httpx.AsyncClient(
-            timeout=60.0, http2=False
-        )
+        self.client = _client_for(self.base_url)
         logger.info(
             f"Initialized OllamaNativeLLM with base_url: {self.base_url}, model: {self.model}"
         )
 
-    import asyncio
-
     async def chat_completion(
         self,
         messages: List[Dict[str, Any]],
         system: Optional[str] = None,
         tools: Optional[List[Dict[str, Any]]] = None,
     ) -> AsyncIterator[str]:
-        # 预处理消息（与之前相同）
-        processed_messages = []
-        if system:
-            processed_messages.append(
-                {"role": "system", "content": system}
-            )
-        for msg in messages:
-            content = msg.get("content")
-            if isinstance(content, list):
-                texts = []
-                for part in content:
-                    if (
-                        isinstance(part, dict)
-                        and part.get("type") == "text"
-                    ):
-                        texts.append(part.get("text", ""))
-                msg["content"] = " ".join(texts)
-            processed_messages.append(msg)
+        processed_messages = (
+            messages
+            if _already_ollama_ready(messages, system)
+            else _normalize_messages(messages, system)
+        )
 
         payload = {
             "model": self.model,
             "messages": processed_messages,
-            "stream": False,  # 保持非流式，以使用同步 requests
+            "stream": True,
             "options": {
                 "temperature": self.temperature,
                 "num_keep_alive": self.keep_alive,
@@ -64,35 +107,60 @@ class OllamaNativeLLM(StatelessLLMInterface):
         }
         logger.debug(f"Ollama request payload: {payload}")
 
-        # 使用 asyncio.to_thread 在后台线程中执行同步 requests.post
+        # 流式读取 Ollama 的 NDJSON 响应，逐段产出内容
         try:
-            response = await asyncio.to_thread(
-                requests.post,
+            async with self.client.stream(
+                "POST",
                 f"{self.base_url}/api/chat",
                 json=payload,
-                headers={
-                    "Content-Type": "application/json"
-                },
-                timeout=60,
-            )
-            if response.status_code != 200:
-                logger.error(
-                    f"Ollama returned {response.status_code}: {response.text}"
-                )
-                yield f"Error: Ollama returned {response.status_code}"
-                return
-            data = response.json()
-            if (
-                "message" in data
-                and "content" in data["message"]
-            ):
-                yield data["message"]["content"]
-            else:
-                logger.error(f"Unexpected response: {data}")
-                yield f"Error: Unexpected response"
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    logger.error(
+                        f"Ollama returned {response.status_code}: {body.decode(errors='replace')}"
+                    )
+                    yield f"Error: Ollama returned {response.status_code}"
+                    return
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = orjson.loads(line)
+                    # 流中途出错时 Ollama 仍返回 200，错误放在 error 字段里
+                    if data.get("error"):
+                        logger.error(
+                            f"Ollama stream error: {data['error']}"
+                        )
+                        yield f"Error: {data['error']}"
+                        return
+                    content = data.get("message", {}).get(
+                        "content"
+                    )
+                    if content:
+                        yield content
+                    if data.get("done"):
+                        break
         except Exception as e:
             logger.exception(f"Ollama request failed: {e}")
             yield f"Error: {e}"
 
+    async def warmup(self) -> None:
+        """Ask Ollama to load the model, without generating anything."""
+        try:
+            response = await self.client.post(
+                f"{self.base_url}/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": [],
+                    "keep_alive": self.keep_alive,
+                },
+            )
+            logger.debug(
+                f"Ollama warmup returned {response.status_code}"
+            )
+        except Exception as e:
+            logger.warning(f"Ollama warmup failed: {e}")
+
     async def close(self):
-        await self.client.aclose()
+        # The client is shared by every instance with the same base_url;
+        # aclose_clients() closes it on server shutdown.
+        pass
@@ -62,3 +62,10 @@ class StatelessLLMInterface(metaclass=abc.ABCMeta):
         - APIError: For other API-related errors
         """
         raise NotImplementedError
+
+    async def warmup(self) -> None:
+        """
+        Optionally prepare the backend (e.g. load the model into memory) so the
+        next chat completion starts faster. Must not raise. Does nothing by default.
+        """
+        return None
@@ -1,4 +1,6 @@
-from typing import Type
+import json
+import weakref
+from typing import Tuple, Type
 
 from loguru import logger
 
@@ -13,7 +15,26 @@ from .stateless_llm.openai_compatible_llm import (
 )
 from .stateless_llm.ollama_llm import OllamaLLM
 from .stateless_llm.claude_llm import AsyncLLM as ClaudeLLM
-from .stateless_llm.ollama_native_llm import OllamaNativeLLM
+from .stateless_llm.ollama_native_llm import (
+    OllamaNativeLLM,
+    aclose_clients as aclose_ollama_clients,
+)
+
+
+# 已创建的 LLM 实例池，按 (provider, 配置) 复用，避免重复建立连接池。
+# 只持有弱引用：不再被任何 agent 使用的 LLM 照常被回收（例如 OllamaLLM
+# 在 __del__ 中卸载模型）
+_LLM_POOL: "weakref.WeakValueDictionary[Tuple[str, str], StatelessLLMInterface]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _pool_key(llm_provider: str, kwargs: dict) -> Tuple[str, str]:
+    """Build a hashable key from the provider and its (possibly nested) config."""
+    return (
+        llm_provider,
+        json.dumps(kwargs, sort_keys=True, default=str),
+    )
 
 
 class LLMFactory:
@@ -23,10 +44,48 @@ class LLMFactory:
     ) -> Type[StatelessLLMInterface]:
         """Create an LLM based on the configuration.
 
+        Instances are pooled by provider and configuration, so creating an
+        agent again with the same settings reuses the existing LLM and its
+        HTTP connections while another agent still holds it.
+
         Args:
             llm_provider: The type of LLM to create
             **kwargs: Additional arguments
         """
+        key = _pool_key(llm_provider, kwargs)
+        llm = _LLM_POOL.get(key)
+        if llm is not None:
+            logger.debug(f"Reusing pooled LLM: {llm_provider}")
+            return llm
+        llm = LLMFactory._create_llm(llm_provider, **kwargs)
+        _LLM_POOL[key] = llm
+        return llm
+
+    @staticmethod
+    async def aclose_all() -> None:
+        """Close every pooled LLM that holds resources and empty the pool,
+        then the HTTP clients shared by OllamaNativeLLM instances."""
+        llms = list(_LLM_POOL.values())
+        _LLM_POOL.clear()
+        for llm in llms:
+            close = getattr(llm, "close", None)
+            if close is None:
+                continue
+            try:
+                await close()
+            except Exception as e:
+                logger.warning(
+                    f"Failed to close LLM {type(llm).__name__}: {e}"
+                )
+        try:
+            await aclose_ollama_clients()
+        except Exception as e:
+            logger.warning(f"Failed to close Ollama HTTP clients: {e}")
+
+    @staticmethod
+    def _create_llm(
+        llm_provider, **kwargs
+    ) -> Type[StatelessLLMInterface]:
         logger.info(f"Initializing LLM: {llm_provider}")
         if kwargs is None:
             kwargs = {}
@@ -1,12 +1,28 @@
 import os
 import re
 import json
+import threading
 import uuid
 from datetime import datetime
 from typing import Literal, List, TypedDict, Optional
 from loguru import logger
 
 
+# 每个历史文件一把锁：写入是“读取-修改-整体重写”，事件循环线程和
+# 工作线程（asyncio.to_thread）并发写同一文件时会读到被截断的内容
+_HISTORY_LOCKS: dict[str, threading.Lock] = {}
+_HISTORY_LOCKS_GUARD = threading.Lock()
+
+
+def _history_lock(filepath: str) -> threading.Lock:
+    """Lock serializing read-modify-write updates of one history file"""
+    with _HISTORY_LOCKS_GUARD:
+        lock = _HISTORY_LOCKS.get(filepath)
+        if lock is None:
+            lock = _HISTORY_LOCKS[filepath] = threading.Lock()
+        return lock
+
+
 class HistoryMessage(TypedDict):
     role: Literal["human", "ai"]
     timestamp: str
@@ -118,32 +134,33 @@ def store_message(
     filepath = _get_safe_history_path(conf_uid, history_uid)
     logger.debug(f"Storing {role} message to {filepath}")
 
-    history_data = []
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                history_data = json.load(f)
-        except Exception:
-            logger.error(f"Failed to load history file: {filepath}")
-            pass
-
-    now_str = datetime.now().isoformat(timespec="seconds")
-    new_item = {
-        "role": role,
-        "timestamp": now_str,
-        "content": content,
-    }
-
-    # Add optional display information if provided
-    if name is not None:
-        new_item["name"] = name
-    if avatar is not None:
-        new_item["avatar"] = avatar
-
-    history_data.append(new_item)
-
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(history_data, f, ensure_ascii=False, indent=2)
+    with _history_lock(filepath):
+        history_data = []
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    history_data = json.load(f)
+            except Exception:
+                logger.error(f"Failed to load history file: {filepath}")
+                pass
+
+        now_str = datetime.now().isoformat(timespec="seconds")
+        new_item = {
+            "role": role,
+            "timestamp": now_str,
+            "content": content,
+        }
+
+        # Add optional display information if provided
+        if name is not None:
+            new_item["name"] = name
+        if avatar is not None:
+            new_item["avatar"] = avatar
+
+        history_data.append(new_item)
+
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(history_data, f, ensure_ascii=False, indent=2)
     logger.debug(f"Successfully stored {role} message")
 
 
@@ -181,23 +198,24 @@ def update_metadate(conf_uid: str, history_uid: str, metadata: dict) -> bool:
         return False
 
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            history_data = json.load(f)
-
-        if history_data and history_data[0]["role"] == "metadata":
-            # Update existing metadata while preserving other fields
-            history_data[0].update(metadata)
-        else:
-            # Create new metadata with timestamp if none exists
-            new_metadata = {
-                "role": "metadata",
-                "timestamp": datetime.now().isoformat(timespec="seconds"),
-            }
-            new_metadata.update(metadata)  # Add new fields
-            history_data.insert(0, new_metadata)
+        with _history_lock(filepath):
+            with open(filepath, "r", encoding="utf-8") as f:
+                history_data = json.load(f)
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(history_data, f, ensure_ascii=False, indent=2)
+            if history_data and history_data[0]["role"] == "metadata":
+                # Update existing metadata while preserving other fields
+                history_data[0].update(metadata)
+            else:
+                # Create new metadata with timestamp if none exists
+                new_metadata = {
+                    "role": "metadata",
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                }
+                new_metadata.update(metadata)  # Add new fields
+                history_data.insert(0, new_metadata)
+
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(history_data, f, ensure_ascii=False, indent=2)
 
         logger.debug(f"Updated metadata for history {history_uid}")
         return True
@@ -325,23 +343,24 @@ def modify_latest_message(
         return False
 
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            history_data = json.load(f)
+        with _history_lock(filepath):
+            with open(filepath, "r", encoding="utf-8") as f:
+                history_data = json.load(f)
 
-        if not history_data:
-            logger.warning("History is empty")
-            return False
+            if not history_data:
+                logger.warning("History is empty")
+                return False
 
-        latest_message = history_data[-1]
-        if latest_message["role"] != role:
-            logger.warning(
-                f"Latest message role ({latest_message['role']}) doesn't match requested role ({role})"
-            )
-            return False
+            latest_message = history_data[-1]
+            if latest_message["role"] != role:
+                logger.warning(
+                    f"Latest message role ({latest_message['role']}) doesn't match requested role ({role})"
+                )
+                return False
 
-        latest_message["content"] = new_content
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(history_data, f, ensure_ascii=False, indent=2)
+            latest_message["content"] = new_content
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(history_data, f, ensure_ascii=False, indent=2)
 
         logger.debug(f"Successfully modified latest {role} message")
         return True
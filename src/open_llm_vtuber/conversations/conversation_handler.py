@@ -1,5 +1,6 @@
 import asyncio
 import json
+import os
 from typing import Dict, Optional, Callable
 
 import numpy as np
@@ -10,7 +11,10 @@ from ..chat_group import ChatGroupManager
 from ..chat_history_manager import store_message
 from ..service_context import ServiceContext
 from .group_conversation import process_group_conversation
-from .single_conversation import process_single_conversation
+from .single_conversation import (
+    process_single_conversation,
+    wait_for_history_writes,
+)
 from .conversation_utils import EMOJI_LIST
 from .types import GroupConversationState
 from prompts import prompt_loader
@@ -105,6 +109,12 @@ async def handle_conversation_trigger(
                 images=images,
                 session_emoji=session_emoji,
                 metadata=metadata,
+                # Binary audio frames need frontend support, so they are opt-in
+                websocket_send_bytes=(
+                    websocket.send_bytes
+                    if os.getenv("TTS_BINARY_AUDIO", "0") == "1"
+                    else None
+                ),
             )
         )
 
@@ -127,6 +137,8 @@ async def handle_individual_interrupt(
             logger.error(f"Error handling interrupt: {e}")
 
         if context.history_uid:
+            # Let writes from the cancelled turn land first
+            await wait_for_history_writes(context.history_uid)
             store_message(
                 conf_uid=context.character_config.conf_uid,
                 history_uid=context.history_uid,
@@ -1,4 +1,3 @@
-import asyncio
 import re
 from typing import Optional, Union, Any, List, Dict
 import numpy as np
@@ -266,8 +265,8 @@ async def finalize_conversation_turn(
     broadcast_ctx: Optional[BroadcastContext] = None,
 ) -> None:
     """Finalize a conversation turn"""
-    if tts_manager.task_list:
-        await asyncio.gather(*tts_manager.task_list)
+    if tts_manager.has_tasks:
+        await tts_manager.wait_for_tasks()
         await websocket_send(
             json.dumps({"type": "backend-synth-complete"})
         )
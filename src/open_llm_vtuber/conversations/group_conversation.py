@@ -267,8 +267,8 @@ async def handle_group_member_turn(
         group_members=group_members,
     )
 
-    if tts_manager.task_list:
-        await asyncio.gather(*tts_manager.task_list)
+    if tts_manager.has_tasks:
+        await tts_manager.wait_for_tasks()
         await current_ws_send(json.dumps({"type": "backend-synth-complete"}))
 
         broadcast_ctx = BroadcastContext(
@@ -1,6 +1,6 @@
-from typing import Union, List, Dict, Any, Optional
+from typing import Union, List, Dict, Any, Optional, Set
 import asyncio
-import json
+import random
 from loguru import logger
 import numpy as np
 
@@ -13,14 +13,82 @@ from .conversation_utils import (
     cleanup_conversation,
     EMOJI_LIST,
 )
-from .types import WebSocketSend
+from .types import WebSocketSend, WebSocketSendBytes
 from .tts_manager import TTSTaskManager
 from ..chat_history_manager import store_message
 from ..service_context import ServiceContext
+from ..utils.json_utils import dumps
 
 # Import necessary types from agent outputs
 from ..agent.output_types import SentenceOutput, AudioOutput
 
+# Duck-typed output classes already warned about
+_warned_output_types: set = set()
+
+
+def _accept_unregistered_output(output_item: Any) -> bool:
+    """Accept outputs shaped like SentenceOutput/AudioOutput whose class was
+    not registered, warning once per class"""
+    if not (
+        (
+            hasattr(output_item, "display_text")
+            and hasattr(output_item, "tts_text")
+        )
+        or (
+            hasattr(output_item, "audio")
+            and hasattr(output_item, "text")
+        )
+    ):
+        return False
+    output_type = type(output_item)
+    if output_type not in _warned_output_types:
+        _warned_output_types.add(output_type)
+        logger.warning(
+            f"Agent output {output_type.__name__} is not a registered output type. "
+            "Duck-typed outputs are deprecated; declare the class in the agent's "
+            "`output_types`, e.g. {SentenceOutput: (MyOutput,)}."
+        )
+    return True
+
+
+def _log_store_failure(task: asyncio.Task) -> None:
+    """Done callback reporting a failed background history write"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            f"Failed to store message to history: {task.exception()}"
+        )
+
+
+# Background history writes still running, by history_uid
+_pending_history_writes: Dict[str, Set[asyncio.Task]] = {}
+
+
+def _store_message_in_background(**kwargs: Any) -> asyncio.Task:
+    """Run store_message in a worker thread, tracked until it finishes"""
+    history_uid = kwargs["history_uid"]
+    task = asyncio.create_task(
+        asyncio.to_thread(store_message, **kwargs)
+    )
+    pending = _pending_history_writes.setdefault(history_uid, set())
+    pending.add(task)
+
+    def _untrack(done: asyncio.Task) -> None:
+        pending.discard(done)
+        if not pending and _pending_history_writes.get(history_uid) is pending:
+            del _pending_history_writes[history_uid]
+
+    task.add_done_callback(_untrack)
+    task.add_done_callback(_log_store_failure)
+    return task
+
+
+async def wait_for_history_writes(history_uid: str) -> None:
+    """Wait for background writes to history_uid, e.g. before the interrupt
+    handler appends to the same history, so messages keep their order"""
+    pending = _pending_history_writes.get(history_uid)
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
 
 async def process_single_conversation(
     context: ServiceContext,
@@ -28,8 +96,9 @@ async def process_single_conversation(
     client_uid: str,
     user_input: Union[str, np.ndarray],
     images: Optional[List[Dict[str, Any]]] = None,
-    session_emoji: str = np.random.choice(EMOJI_LIST),
+    session_emoji: Optional[str] = None,
     metadata: Optional[Dict[str, Any]] = None,
+    websocket_send_bytes: Optional[WebSocketSendBytes] = None,
 ) -> str:
     """Process a single-user conversation turn
 
@@ -39,17 +108,32 @@ async def process_single_conversation(
         client_uid: Client unique identifier
         user_input: Text or audio input from user
         images: Optional list of image data
-        session_emoji: Emoji identifier for the conversation
+        session_emoji: Emoji identifier for the conversation, picked at random if omitted
         metadata: Optional metadata for special processing flags
+        websocket_send_bytes: Optional binary send function; if given, TTS audio
+            is sent as binary frames instead of base64 inside the JSON payload
 
     Returns:
         str: Complete response text
     """
+    if session_emoji is None:
+        session_emoji = random.choice(EMOJI_LIST)
+
     # Create TTSTaskManager for this conversation
-    tts_manager = TTSTaskManager()
+    tts_manager = TTSTaskManager(
+        websocket_send_bytes=websocket_send_bytes
+    )
     full_response = ""  # Initialize full_response here
+    full_response_parts: List[str] = []
 
     try:
+        character_config = context.character_config
+        character_name = character_config.character_name
+        human_name = character_config.human_name
+        avatar = character_config.avatar
+        conf_uid = character_config.conf_uid
+        history_uid = context.history_uid
+
         # Send initial signals
         await send_conversation_start_signals(
             websocket_send
@@ -58,16 +142,25 @@ async def process_single_conversation(
             f"New Conversation Chain {session_emoji} started!"
         )
 
+        # Warm up the agent's backend while ASR transcribes audio input
+        warmup_task: Optional[asyncio.Task] = None
+        if isinstance(user_input, np.ndarray):
+            warmup_task = asyncio.create_task(
+                context.agent_engine.warmup()
+            )
+
         # Process user input
         input_text = await process_user_input(
             user_input, context.asr_engine, websocket_send
         )
+        if warmup_task is not None:
+            await warmup_task
 
         # Create batch input
         batch_input = create_batch_input(
             input_text=input_text,
             images=images,
-            from_name=context.character_config.human_name,
+            from_name=human_name,
             metadata=metadata,
         )
 
@@ -75,13 +168,16 @@ async def process_single_conversation(
         skip_history = metadata and metadata.get(
             "skip_history", False
         )
-        if context.history_uid and not skip_history:
-            store_message(
-                conf_uid=context.character_config.conf_uid,
-                history_uid=context.history_uid,
+        # Write the user message in a worker thread so the agent request
+        # starts without waiting on disk I/O
+        user_store_task: Optional[asyncio.Task] = None
+        if history_uid and not skip_history:
+            user_store_task = _store_message_in_background(
+                conf_uid=conf_uid,
+                history_uid=history_uid,
                 role="human",
                 content=input_text,
-                name=context.character_config.human_name,
+                name=human_name,
             )
 
         if skip_history:
@@ -93,99 +189,58 @@ async def process_single_conversation(
         if images:
             logger.info(f"With {len(images)} images")
 
-        try:
-            # agent.chat yields Union[SentenceOutput, Dict[str, Any]]
-            agent_output_stream = context.agent_engine.chat(
-                batch_input
-            )
+        # TTS tasks queued while streaming are awaited when this scope exits
+        async with tts_manager.task_scope():
+            try:
+                # agent.chat yields Union[SentenceOutput, Dict[str, Any]]
+                agent_output_stream = context.agent_engine.chat(
+                    batch_input
+                )
 
-            async for output_item in agent_output_stream:
-                if (
-                    isinstance(output_item, dict)
-                    and output_item.get("type")
-                    == "tool_call_status"
-                ):
-                    # Handle tool status event: send WebSocket message
-                    output_item["name"] = (
-                        context.character_config.character_name
-                    )
-                    logger.debug(
-                        f"Sending tool status update: {output_item}"
-                    )
+                # Arguments shared by every process_agent_output call
+                process_kwargs = dict(
+                    character_config=character_config,
+                    live2d_model=context.live2d_model,
+                    tts_engine=context.tts_engine,
+                    websocket_send=websocket_send,  # Pass websocket_send for audio/tts messages
+                    tts_manager=tts_manager,
+                    translate_engine=context.translate_engine,
+                    default_avatar=avatar,
+                )
 
-                    await websocket_send(
-                        json.dumps(output_item)
-                    )
+                async for output_item in agent_output_stream:
+                    if isinstance(output_item, dict):
+                        if output_item.get("type") == "tool_call_status":
+                            # Handle tool status event: send WebSocket message
+                            output_item["name"] = character_name
+                            logger.debug(
+                                f"Sending tool status update: {output_item}"
+                            )
 
-                elif isinstance(
-                    output_item,
-                    (SentenceOutput, AudioOutput),
-                ):
-                    # Handle SentenceOutput or AudioOutput
-                    response_part = await process_agent_output(
-                        output=output_item,
-                        character_config=context.character_config,
-                        live2d_model=context.live2d_model,
-                        tts_engine=context.tts_engine,
-                        websocket_send=websocket_send,  # Pass websocket_send for audio/tts messages
-                        tts_manager=tts_manager,
-                        translate_engine=context.translate_engine,
-                        default_avatar=context.character_config.avatar,
-                    )
-                    # Ensure response_part is treated as a string before concatenation
-                    response_part_str = (
-                        str(response_part)
-                        if response_part is not None
-                        else ""
-                    )
-                    full_response += response_part_str  # Accumulate text response
-                else:
-                    # 属性检查作为回退（兼容类型不一致的情况）
-                    if hasattr(
-                        output_item, "display_text"
-                    ) and hasattr(output_item, "tts_text"):
-                        logger.debug(
-                            f"Processing object as SentenceOutput via attribute fallback: {type(output_item)}"
-                        )
-                        response_part = await process_agent_output(
-                            output=output_item,
-                            character_config=context.character_config,
-                            live2d_model=context.live2d_model,
-                            tts_engine=context.tts_engine,
-                            websocket_send=websocket_send,
-                            tts_manager=tts_manager,
-                            translate_engine=context.translate_engine,
-                            default_avatar=context.character_config.avatar,
-                        )
-                        response_part_str = (
-                            str(response_part)
-                            if response_part is not None
-                            else ""
-                        )
-                        full_response += response_part_str
-                    elif hasattr(
-                        output_item, "audio"
-                    ) and hasattr(output_item, "text"):
-                        # 可选的 AudioOutput 回退
-                        logger.debug(
-                            f"Processing object as AudioOutput via attribute fallback: {type(output_item)}"
-                        )
+                            await websocket_send(
+                                dumps(output_item)
+                            )
+                        else:
+                            logger.warning(
+                                f"Received unexpected dict from agent chat stream: {output_item.get('type')}"
+                            )
+                            logger.debug(
+                                f"Unexpected item content: {output_item}"
+                            )
+                    elif isinstance(
+                        output_item, (SentenceOutput, AudioOutput)
+                    ) or _accept_unregistered_output(output_item):
+                        # Handle SentenceOutput or AudioOutput
                         response_part = await process_agent_output(
-                            output=output_item,
-                            character_config=context.character_config,
-                            live2d_model=context.live2d_model,
-                            tts_engine=context.tts_engine,
-                            websocket_send=websocket_send,
-                            tts_manager=tts_manager,
-                            translate_engine=context.translate_engine,
-                            default_avatar=context.character_config.avatar,
+                            output=output_item, **process_kwargs
                         )
-                        response_part_str = (
-                            str(response_part)
-                            if response_part is not None
-                            else ""
-                        )
-                        full_response += response_part_str
+                        # Ensure response_part is treated as a string before joining
+                        if response_part is not None:
+                            response_part_str = str(response_part)
+                            if response_part_str:
+                                full_response_parts.append(
+                                    response_part_str
+                                )  # Accumulate text response
                     else:
                         logger.warning(
                             f"Received unexpected item type from agent chat stream: {type(output_item)}"
@@ -194,26 +249,26 @@ async def process_single_conversation(
                             f"Unexpected item content: {output_item}"
                         )
 
-        except Exception as e:
-            logger.exception(
-                f"Error processing agent response stream: {e}"
-            )  # Log with stack trace
-            await websocket_send(
-                json.dumps(
-                    {
-                        "type": "error",
-                        "message": f"Error processing agent response: {str(e)}",
-                    }
+            except Exception as e:
+                logger.exception(
+                    f"Error processing agent response stream: {e}"
+                )  # Log with stack trace
+                await websocket_send(
+                    dumps(
+                        {
+                            "type": "error",
+                            "message": f"Error processing agent response: {str(e)}",
+                        }
+                    )
                 )
-            )
-            # full_response will contain partial response before error
+                # full_response will contain partial response before error
         # --- End processing agent response ---
+        full_response = "".join(full_response_parts)
 
-        # Wait for any pending TTS tasks
-        if tts_manager.task_list:
-            await asyncio.gather(*tts_manager.task_list)
+        # All TTS tasks have finished once task_scope() exits
+        if tts_manager.has_tasks:
             await websocket_send(
-                json.dumps(
+                dumps(
                     {"type": "backend-synth-complete"}
                 )
             )
@@ -224,27 +279,35 @@ async def process_single_conversation(
             client_uid=client_uid,
         )
 
-        if context.history_uid and full_response:
-            store_message(
-                conf_uid=context.character_config.conf_uid,
-                history_uid=context.history_uid,
+        # Ensure the user message is persisted before the AI reply
+        if user_store_task is not None:
+            await user_store_task
+
+        if history_uid and full_response:
+            logger.info(f"AI response: {full_response}")
+
+            # Write history and send the final full-text concurrently
+            ai_store_task = _store_message_in_background(
+                conf_uid=conf_uid,
+                history_uid=history_uid,
                 role="ai",
                 content=full_response,
-                name=context.character_config.character_name,
-                avatar=context.character_config.avatar,
+                name=character_name,
+                avatar=avatar,
             )
-            logger.info(f"AI response: {full_response}")
-
             # 发送 final full-text 确保气泡显示（已有）
-            await websocket_send(
-                json.dumps(
-                    {
-                        "type": "full-text",
-                        "text": full_response,
-                        "name": context.character_config.character_name,
-                        "avatar": context.character_config.avatar,
-                    }
-                )
+            await asyncio.gather(
+                ai_store_task,
+                websocket_send(
+                    dumps(
+                        {
+                            "type": "full-text",
+                            "text": full_response,
+                            "name": character_name,
+                            "avatar": avatar,
+                        }
+                    )
+                ),
             )
 
             # 注意：不再发送 user-input-transcription 来模拟 AI 回复，
@@ -262,7 +325,7 @@ async def process_single_conversation(
     except Exception as e:
         logger.error(f"Error in conversation chain: {e}")
         await websocket_send(
-            json.dumps(
+            dumps(
                 {
                     "type": "error",
                     "message": f"Conversation error: {str(e)}",
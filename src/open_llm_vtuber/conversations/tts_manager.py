@@ -1,30 +1,136 @@
 import asyncio
-import json
-import re
-import uuid
+import contextlib
+import itertools
+import os
+import sys
+import time
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import AsyncIterator, List, Optional, Dict, Set, Tuple
 from loguru import logger
 
 from ..agent.output_types import DisplayText, Actions
 from ..live2d_model import Live2dModel
 from ..tts.tts_interface import TTSInterface
-from ..utils.stream_audio import prepare_audio_payload
-from .types import WebSocketSend
+from ..utils.json_utils import dumps
+from ..utils.stream_audio import (
+    prepare_audio_frames,
+    prepare_audio_payload,
+)
+from .types import WebSocketSend, WebSocketSendBytes
+
+# Upper bound on payloads combined into one audio_batch frame
+MAX_PAYLOAD_BATCH = 16
+
+# Sentences queued but not yet sent before speak() waits for the sender
+MAX_REORDER_BUFFER = 32
+
+# Temp file names for engines that synthesize to disk: a per-process
+# timestamp plus a counter, unique without a uuid per sentence
+_TTS_SEQ = itertools.count()
+_TTS_PREFIX = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+# Punctuation and whitespace that on their own leave nothing to synthesize
+_PUNCT_CHARS = " \t\r\n.,!?，。！？'\"’”』」）】)\u3000"
+_PUNCT_TABLE = str.maketrans("", "", _PUNCT_CHARS)
+
+
+def _concurrent_requests_from_env() -> int:
+    """Read TTS_CONCURRENT_REQUESTS, falling back to 2 and never below 1"""
+    value = os.getenv("TTS_CONCURRENT_REQUESTS", "2")
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(
+            f"Invalid TTS_CONCURRENT_REQUESTS={value!r}, using 2"
+        )
+        return 2
 
 
 class TTSTaskManager:
-    """Manages TTS tasks and ensures ordered delivery to frontend while allowing parallel TTS generation"""
+    """Manages TTS tasks and ensures ordered delivery to frontend while allowing parallel TTS generation
+
+    When the TTS_BATCH_PAYLOADS environment variable is "1", consecutive
+    payloads that are ready at the same time are sent as a single
+    {"type": "audio_batch", "items": [...]} frame. This requires a frontend
+    that understands audio_batch, so it is off by default. Small frames left
+    unbatched (silent payloads, control messages) are not held back by
+    Nagle's algorithm: asyncio and uvloop enable TCP_NODELAY on every TCP
+    transport uvicorn accepts, so each send is flushed immediately.
+
+    At most TTS_CONCURRENT_REQUESTS (default 2) syntheses run at once, so a
+    burst of sentences does not flood the TTS backend while the frontend
+    plays them one at a time.
 
-    def __init__(self) -> None:
-        self.task_list: List[asyncio.Task] = []
+    Once MAX_REORDER_BUFFER sentences are queued but not yet sent (e.g. a
+    slow sentence holds back the ones after it), speak() waits for the
+    sender to catch up, so the reorder buffer stays bounded without
+    dropping anything. metrics() reports the deepest the buffer got.
+
+    Args:
+        websocket_send_bytes: If given, synthesized audio is sent as a binary
+            frame right after its JSON payload (marked "audio_binary": true,
+            with "audio": null) instead of base64 inside the JSON.
+    """
+
+    def __init__(
+        self,
+        websocket_send_bytes: Optional[WebSocketSendBytes] = None,
+    ) -> None:
+        # Running TTS tasks; each removes itself when done
+        self._tasks: Set[asyncio.Task] = set()
+        # TTS tasks queued by speak() since the last clear()
+        self._tasks_started = 0
         self._lock = asyncio.Lock()
-        self._payload_queue: asyncio.Queue[Dict] = (
-            asyncio.Queue()
-        )
+        self._websocket_send_bytes = websocket_send_bytes
+        # (payload, sequence_number, audio bytes sent as a binary frame or None)
+        self._payload_queue: asyncio.Queue[
+            Tuple[Dict, int, Optional[bytes]]
+        ] = asyncio.Queue()
         self._sender_task: Optional[asyncio.Task] = None
         self._sequence_counter = 0
         self._next_sequence_to_send = 0
+        self._task_group: Optional["asyncio.TaskGroup"] = None
+        self._batch_payloads = (
+            os.getenv("TTS_BATCH_PAYLOADS", "0") == "1"
+        )
+        self._synth_sem = asyncio.Semaphore(
+            _concurrent_requests_from_env()
+        )
+        # Reorder buffer bound and the deepest it has been
+        self._max_buffer = MAX_REORDER_BUFFER
+        self._max_depth = 0
+        # Set by the sender whenever it sends, to wake a waiting speak()
+        self._buffer_space = asyncio.Event()
+
+    @contextlib.asynccontextmanager
+    async def task_scope(self) -> AsyncIterator[None]:
+        """
+        Scope the TTS tasks created by speak() to the enclosed block.
+
+        Leaving the block waits for every TTS task. On Python 3.11+ the tasks
+        run in an asyncio.TaskGroup, so cancelling the block also cancels them;
+        older versions wait for the running tasks on exit instead.
+        """
+        if sys.version_info >= (3, 11):
+            async with asyncio.TaskGroup() as task_group:
+                self._task_group = task_group
+                try:
+                    yield
+                finally:
+                    self._task_group = None
+        else:
+            yield
+            await self.wait_for_tasks()
+
+    @property
+    def has_tasks(self) -> bool:
+        """Whether speak() queued any TTS task since the last clear()"""
+        return self._tasks_started > 0
+
+    async def wait_for_tasks(self) -> None:
+        """Wait for the TTS tasks that are still running"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
 
     async def speak(
         self,
@@ -40,16 +146,12 @@ class TTSTaskManager:
         """
         if not isinstance(tts_text, str):
             tts_text = str(tts_text)
-        if (
-            len(
-                re.sub(
-                    r'[\s.,!?，。！？\'"』」）】\s]+',
-                    "",
-                    tts_text,
-                )
-            )
-            == 0
-        ):
+        display_dict = (
+            display_text.to_dict() if display_text else None
+        )
+        actions_dict = actions.to_dict() if actions else None
+        await self._wait_for_buffer_space()
+        if not tts_text.translate(_PUNCT_TABLE).strip():
             logger.debug(
                 "Empty TTS text, sending silent display payload"
             )
@@ -57,14 +159,8 @@ class TTSTaskManager:
             self._sequence_counter += 1
             await self._ensure_sender_task(websocket_send)
             await self._send_silent_payload(
-                display_text=(
-                    display_text.to_dict()
-                    if display_text
-                    else None
-                ),
-                actions=(
-                    actions.to_dict() if actions else None
-                ),
+                display_text=display_dict,
+                actions=actions_dict,
                 sequence_number=current_sequence,
             )
             return
@@ -78,17 +174,37 @@ class TTSTaskManager:
 
         await self._ensure_sender_task(websocket_send)
 
-        task = asyncio.create_task(
+        create_task = (
+            self._task_group.create_task
+            if self._task_group is not None
+            else asyncio.create_task
+        )
+        task = create_task(
             self._process_tts(
                 tts_text=tts_text,
-                display_text=display_text,
-                actions=actions,
+                display_dict=display_dict,
+                actions_dict=actions_dict,
                 live2d_model=live2d_model,
                 tts_engine=tts_engine,
                 sequence_number=current_sequence,
             )
         )
-        self.task_list.append(task)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._tasks_started += 1
+
+    async def _wait_for_buffer_space(self) -> None:
+        """Backpressure: wait while too many sentences are queued but unsent"""
+        while (
+            self._sequence_counter - self._next_sequence_to_send
+            >= self._max_buffer
+        ):
+            logger.debug(
+                f"{self._max_buffer} sentences waiting on sequence "
+                f"{self._next_sequence_to_send}; pausing speak()"
+            )
+            self._buffer_space.clear()
+            await self._buffer_space.wait()
 
     async def _ensure_sender_task(
         self, websocket_send: WebSocketSend
@@ -109,32 +225,81 @@ class TTSTaskManager:
         """
         Process and send payloads in correct order. Runs forever, handling exceptions.
         """
-        buffered_payloads: Dict[int, Dict] = {}
+        buffered_payloads: Dict[
+            int, Tuple[Dict, Optional[bytes]]
+        ] = {}
+        batch_limit = (
+            MAX_PAYLOAD_BATCH if self._batch_payloads else 1
+        )
 
         while True:
             try:
-                payload, sequence_number = (
+                payload, sequence_number, audio_bytes = (
                     await self._payload_queue.get()
                 )
-                buffered_payloads[sequence_number] = payload
+                buffered_payloads[sequence_number] = (
+                    payload,
+                    audio_bytes,
+                )
+                received = 1
+
+                if self._batch_payloads:
+                    # Pick up whatever else is already queued without waiting
+                    while not self._payload_queue.empty():
+                        payload, sequence_number, audio_bytes = (
+                            self._payload_queue.get_nowait()
+                        )
+                        buffered_payloads[sequence_number] = (
+                            payload,
+                            audio_bytes,
+                        )
+                        received += 1
+
+                self._max_depth = max(
+                    self._max_depth, len(buffered_payloads)
+                )
 
                 # Send payloads in order
                 while (
                     self._next_sequence_to_send
                     in buffered_payloads
                 ):
-                    next_payload = buffered_payloads.pop(
+                    first_sequence = self._next_sequence_to_send
+                    batch: List[Tuple[Dict, Optional[bytes]]] = []
+                    while (
                         self._next_sequence_to_send
-                    )
-                    await websocket_send(
-                        json.dumps(next_payload)
-                    )
+                        in buffered_payloads
+                        and len(batch) < batch_limit
+                    ):
+                        batch.append(
+                            buffered_payloads.pop(
+                                self._next_sequence_to_send
+                            )
+                        )
+                        self._next_sequence_to_send += 1
+
+                    payloads = [payload for payload, _ in batch]
+                    if len(payloads) == 1:
+                        await websocket_send(dumps(payloads[0]))
+                    else:
+                        await websocket_send(
+                            dumps(
+                                {"type": "audio_batch", "items": payloads}
+                            )
+                        )
+                    # Binary audio frames follow their metadata in order
+                    for _, audio_bytes in batch:
+                        if audio_bytes is not None:
+                            await self._websocket_send_bytes(
+                                audio_bytes
+                            )
                     logger.debug(
-                        f"Sent payload for sequence {self._next_sequence_to_send}"
+                        f"Sent payloads for sequences {first_sequence}-{self._next_sequence_to_send - 1}"
                     )
-                    self._next_sequence_to_send += 1
+                    self._buffer_space.set()
 
-                self._payload_queue.task_done()
+                for _ in range(received):
+                    self._payload_queue.task_done()
 
             except asyncio.CancelledError:
                 logger.debug("Sender task cancelled")
@@ -145,6 +310,10 @@ class TTSTaskManager:
                 await asyncio.sleep(0.1)
                 continue
 
+    def metrics(self) -> Dict[str, int]:
+        """Reorder buffer statistics for this conversation"""
+        return {"max_depth": self._max_depth}
+
     async def _send_silent_payload(
         self,
         display_text: dict,  # 改为接收字典
@@ -157,7 +326,7 @@ class TTSTaskManager:
             actions=actions,
         )
         await self._payload_queue.put(
-            (audio_payload, sequence_number)
+            (audio_payload, sequence_number, None)
         )
         logger.debug(
             f"Queued silent payload for sequence {sequence_number}"
@@ -166,31 +335,44 @@ class TTSTaskManager:
     async def _process_tts(
         self,
         tts_text: str,
-        display_text: DisplayText,
-        actions: Optional[Actions],
+        display_dict: Optional[Dict],
+        actions_dict: Optional[Dict],
         live2d_model: Live2dModel,
         tts_engine: TTSInterface,
         sequence_number: int,
     ) -> None:
-        # 提前转换为字典
-        display_dict = (
-            display_text.to_dict() if display_text else None
-        )
-        actions_dict = (
-            actions.to_dict() if actions else None
-        )
-        audio_file_path = None
         try:
-            audio_file_path = await self._generate_audio(
-                tts_engine, tts_text
-            )
-            payload = prepare_audio_payload(
-                audio_path=audio_file_path,
-                display_text=display_dict,
-                actions=actions_dict,
-            )
+            wait_start = time.perf_counter()
+            async with self._synth_sem:
+                logger.debug(
+                    f"TTS sequence {sequence_number} waited "
+                    f"{(time.perf_counter() - wait_start) * 1000:.1f} ms for a synthesis slot "
+                    f"({self._payload_queue.qsize()} payloads queued)"
+                )
+                tts_audio = await self._generate_audio(
+                    tts_engine, tts_text
+                )
+            # 解码、计算音量和编码都是 CPU 密集操作，放到线程里避免阻塞事件循环
+            audio_bytes = None
+            if self._websocket_send_bytes is not None:
+                payload, audio_bytes = await asyncio.to_thread(
+                    prepare_audio_frames,
+                    None,
+                    audio_bytes=tts_audio,
+                    display_text=display_dict,
+                    actions=actions_dict,
+                )
+                payload["audio_binary"] = audio_bytes is not None
+            else:
+                payload = await asyncio.to_thread(
+                    prepare_audio_payload,
+                    None,
+                    audio_bytes=tts_audio,
+                    display_text=display_dict,
+                    actions=actions_dict,
+                )
             await self._payload_queue.put(
-                (payload, sequence_number)
+                (payload, sequence_number, audio_bytes)
             )
             logger.debug(
                 f"Queued audio payload for sequence {sequence_number}"
@@ -207,39 +389,43 @@ class TTSTaskManager:
                 actions=actions_dict,
             )
             await self._payload_queue.put(
-                (payload, sequence_number)
+                (payload, sequence_number, None)
             )
             logger.debug(
                 f"Queued silent payload (fallback) for sequence {sequence_number}"
             )
 
-        finally:
-            if audio_file_path:
-                try:
-                    tts_engine.remove_file(audio_file_path)
-                except Exception as e:
-                    logger.warning(
-                        f"Failed to remove audio file {audio_file_path}: {e}"
-                    )
-
     async def _generate_audio(
         self, tts_engine: TTSInterface, text: str
-    ) -> str:
-        """Generate audio file from text"""
+    ) -> bytes:
+        """Generate encoded audio bytes from text"""
         logger.debug(
             f"🏃Generating audio for '''{text}'''..."
         )
-        return await tts_engine.async_generate_audio(
+        return await tts_engine.async_generate_audio_bytes(
             text=text,
-            file_name_no_ext=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}",
+            file_name_no_ext=f"{_TTS_PREFIX}_{next(_TTS_SEQ):08x}",
         )
 
     def clear(self) -> None:
         """Clear all pending tasks and reset state"""
-        self.task_list.clear()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        self._tasks_started = 0
         if self._sender_task:
+            # clear() is synchronous, so the cancelled sender is not awaited;
+            # forget it so the next speak() starts a fresh one
             self._sender_task.cancel()
+            self._sender_task = None
         self._sequence_counter = 0
         self._next_sequence_to_send = 0
-        self._payload_queue = asyncio.Queue()
+        self._buffer_space.set()
+        # Drain rather than replace the queue so its unfinished-task count stays consistent
+        try:
+            while True:
+                self._payload_queue.get_nowait()
+                self._payload_queue.task_done()
+        except asyncio.QueueEmpty:
+            pass
         logger.debug("TTSTaskManager cleared")
@@ -17,6 +17,7 @@ from starlette.staticfiles import StaticFiles as StarletteStaticFiles
 from .routes import init_client_ws_route, init_webtool_routes, init_proxy_route
 from .service_context import ServiceContext
 from .config_manager.utils import Config
+from .agent.stateless_llm_factory import LLMFactory as StatelessLLMFactory
 
 
 # Create a custom StaticFiles class that adds CORS headers
@@ -88,6 +89,9 @@ class WebSocketServer:
             allow_headers=["*"],
         )
 
+        # Release connections held by pooled LLM instances on shutdown
+        self.app.add_event_handler("shutdown", StatelessLLMFactory.aclose_all)
+
         # Include routes, passing the context instance
         # The context will be populated during the initialize step
         self.app.include_router(
@@ -1,13 +1,9 @@
-import sys
 import os
 
 import edge_tts
 from loguru import logger
 from .tts_interface import TTSInterface
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.append(current_dir)
-
 
 class TTSEngine(TTSInterface):
     def __init__(self, voice="en-US-AvaMultilingualNeural"):
@@ -54,6 +50,41 @@ class TTSEngine(TTSInterface):
 
         return file_name
 
+    async def async_generate_audio_bytes(
+        self, text, file_name_no_ext=None
+    ) -> bytes:
+        """
+        Generate speech audio in memory by streaming from edge-tts.
+        text: str
+            the text to speak
+        file_name_no_ext: str
+            unused, kept for interface compatibility
+
+        Returns:
+        bytes: the mp3 audio
+
+        Raises:
+        Exception: if TTS generation fails
+        """
+        buf = bytearray()
+        try:
+            communicate = edge_tts.Communicate(
+                text, self.voice
+            )
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    buf += chunk["data"]
+        except Exception as e:
+            logger.critical(
+                f"\nError: edge-tts unable to generate audio: {e}"
+            )
+            logger.critical(
+                "It's possible that edge-tts is blocked in your region."
+            )
+            raise e
+
+        return bytes(buf)
+
     def remove_file(self, file_path: str) -> None:
         """Safely remove a file, ignoring None or non-existent paths."""
         if not file_path:
@@ -24,6 +24,36 @@ class TTSInterface(metaclass=abc.ABCMeta):
         """
         return await asyncio.to_thread(self.generate_audio, text, file_name_no_ext)
 
+    async def async_generate_audio_bytes(
+        self, text: str, file_name_no_ext=None
+    ) -> bytes:
+        """
+        Asynchronously generate speech audio and return the encoded audio bytes.
+
+        By default, this generates an audio file with async_generate_audio,
+        reads it back and removes it. Engines that can produce audio in memory
+        should override this to skip the file system.
+
+        text: str
+            the text to speak
+        file_name_no_ext (optional and deprecated): str
+            name of the temporary file without file extension
+
+        Returns:
+        bytes: the encoded audio (in the engine's output format)
+
+        """
+        audio_file_path = await self.async_generate_audio(text, file_name_no_ext)
+        try:
+            return await asyncio.to_thread(self._read_audio_file, audio_file_path)
+        finally:
+            self.remove_file(audio_file_path)
+
+    @staticmethod
+    def _read_audio_file(filepath: str) -> bytes:
+        with open(filepath, "rb") as f:
+            return f.read()
+
     @abc.abstractmethod
     def generate_audio(self, text: str, file_name_no_ext=None) -> str:
         """
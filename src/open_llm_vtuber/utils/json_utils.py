@@ -0,0 +1,14 @@
+from typing import Any
+
+import orjson
+
+
+def dumps(obj: Any) -> str:
+    """Serialize a websocket message to a JSON string with orjson.
+
+    Values orjson cannot encode are sent as their str() instead of failing
+    the whole message. Non-string dict keys are accepted like json.dumps does.
+    """
+    return orjson.dumps(
+        obj, default=str, option=orjson.OPT_NON_STR_KEYS
+    ).decode("utf-8")
@@ -1,71 +1,141 @@
 import base64
+import io
+import threading
+import wave
+import numpy as np
 from pydub import AudioSegment
-from pydub.utils import make_chunks
 from loguru import logger
 
+# numpy dtypes for the PCM sample widths pydub exposes via raw_data
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+# Per-thread float32 scratch buffer reused across utterances; payloads are
+# prepared in worker threads, so each thread keeps its own
+_scratch = threading.local()
+
+# Constant fields of a silent-display payload; copied per call (shallowly,
+# so the shared "volumes" list must not be mutated)
+_SILENT_SKELETON = {
+    "type": "audio",
+    "audio": None,
+    "volumes": [],
+    "slice_length": 20,
+    "forwarded": False,
+}
+
+
+def _scratch_f32(size: int) -> np.ndarray:
+    """Return a float32 view of length size into this thread's scratch buffer,
+    growing it to the next power of two when too small."""
+    buf = getattr(_scratch, "f32", None)
+    if buf is None or buf.size < size:
+        buf = np.empty(1 << max(size - 1, 0).bit_length(), dtype=np.float32)
+        _scratch.f32 = buf
+    return buf[:size]
+
 
 def _get_volume_by_chunks(
     audio: AudioSegment, chunk_length_ms: int
 ) -> list:
-    chunks = make_chunks(audio, chunk_length_ms)
-    volumes = [chunk.rms for chunk in chunks]
-    max_volume = max(volumes)
+    """RMS volume of each chunk_length_ms slice, normalized to the loudest slice.
+
+    Channels are interleaved in raw_data, so each slice's RMS covers all
+    channels, the same as pydub's AudioSegment.rms. A trailing partial slice
+    is kept.
+    """
+    if audio.sample_width not in _SAMPLE_DTYPES:
+        audio = audio.set_sample_width(2)
+    samples = np.frombuffer(
+        audio.raw_data, dtype=_SAMPLE_DTYPES[audio.sample_width]
+    )
+    squares = np.square(
+        samples, out=_scratch_f32(samples.size), dtype=np.float32
+    )
+
+    samples_per_chunk = max(
+        1,
+        int(audio.frame_rate * chunk_length_ms / 1000)
+        * audio.channels,
+    )
+    full_chunks = squares.size // samples_per_chunk
+    split = full_chunks * samples_per_chunk
+    volumes = np.sqrt(
+        squares[:split]
+        .reshape(full_chunks, samples_per_chunk)
+        .mean(axis=1)
+    )
+    if split < squares.size:
+        volumes = np.append(volumes, np.sqrt(squares[split:].mean()))
+
+    max_volume = volumes.max() if volumes.size else 0
     if max_volume == 0:
         raise ValueError("Audio is empty or all zero.")
-    return [volume / max_volume for volume in volumes]
+    return (volumes / max_volume).tolist()
 
 
-def prepare_audio_payload(
+def _to_wav_bytes(audio: AudioSegment) -> bytes:
+    """Wrap the decoded PCM in a WAV container in memory."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(audio.channels)
+        wav_file.setsampwidth(audio.sample_width)
+        wav_file.setframerate(audio.frame_rate)
+        wav_file.writeframes(audio.raw_data)
+    return buffer.getvalue()
+
+
+def prepare_audio_frames(
     audio_path: str | None,
     chunk_length_ms: int = 20,
     display_text: dict | None = None,
     actions: dict | None = None,
     forwarded: bool = False,
-) -> dict[str, any]:
+    audio_bytes: bytes | None = None,
+) -> tuple[dict[str, any], bytes | None]:
     """
-    Prepares the audio payload for sending to a broadcast endpoint.
-    If audio_path is None, returns a payload with audio=None for silent display.
+    Prepares the audio payload with the WAV bytes kept separate, for sending the
+    audio as a binary websocket frame after the JSON metadata.
 
-    Parameters:
-        audio_path (str | None): The path to the audio file to be processed, or None for silent display
-        chunk_length_ms (int): The length of each audio chunk in milliseconds
-        display_text (dict, optional): Dictionary with 'text', 'name', 'avatar' for display
-        actions (dict, optional): Dictionary of actions associated with the audio
-        forwarded (bool): Whether this is forwarded audio
+    Parameters are the same as prepare_audio_payload.
 
     Returns:
-        dict: The audio payload to be sent
+        tuple: The payload with "audio" set to None, and the WAV bytes
+        (None for silent display)
     """
-    if not audio_path:
+    if not audio_path and audio_bytes is None:
         # Return payload for silent display
         logger.debug(
             f"Creating silent payload for display text: {display_text}"
         )
-        return {
-            "type": "audio",
-            "audio": None,
-            "volumes": [],
-            "slice_length": chunk_length_ms,
-            "display_text": display_text,
-            "actions": actions,
-            "forwarded": forwarded,
-        }
+        payload = _SILENT_SKELETON.copy()
+        payload["slice_length"] = chunk_length_ms
+        payload["display_text"] = display_text
+        payload["actions"] = actions
+        payload["forwarded"] = forwarded
+        return payload, None
 
     try:
-        audio = AudioSegment.from_file(audio_path)
-        audio_bytes = audio.export(format="wav").read()
+        if audio_bytes is not None:
+            # WAV bytes carry no file extension; name the format so pydub
+            # reads them natively instead of probing them with ffmpeg
+            audio = AudioSegment.from_file(
+                io.BytesIO(audio_bytes),
+                format=(
+                    "wav" if audio_bytes[:4] == b"RIFF" else None
+                ),
+            )
+        else:
+            audio = AudioSegment.from_file(audio_path)
+        wav_bytes = _to_wav_bytes(audio)
     except Exception as e:
         raise ValueError(
-            f"Error loading or converting generated audio file to wav file '{audio_path}': {e}"
+            f"Error loading or converting generated audio to wav '{audio_path or '<memory>'}': {e}"
         )
-    audio_base64 = base64.b64encode(audio_bytes).decode(
-        "utf-8"
-    )
     volumes = _get_volume_by_chunks(audio, chunk_length_ms)
 
     payload = {
         "type": "audio",
-        "audio": audio_base64,
+        "audio": None,
         "volumes": volumes,
         "slice_length": chunk_length_ms,
         "display_text": display_text,
@@ -73,4 +143,43 @@ def prepare_audio_payload(
         "forwarded": forwarded,
     }
 
+    return payload, wav_bytes
+
+
+def prepare_audio_payload(
+    audio_path: str | None,
+    chunk_length_ms: int = 20,
+    display_text: dict | None = None,
+    actions: dict | None = None,
+    forwarded: bool = False,
+    audio_bytes: bytes | None = None,
+) -> dict[str, any]:
+    """
+    Prepares the audio payload for sending to a broadcast endpoint.
+    If both audio_path and audio_bytes are None, returns a payload with audio=None
+    for silent display.
+
+    Parameters:
+        audio_path (str | None): The path to the audio file to be processed, or None for silent display
+        chunk_length_ms (int): The length of each audio chunk in milliseconds
+        display_text (dict, optional): Dictionary with 'text', 'name', 'avatar' for display
+        actions (dict, optional): Dictionary of actions associated with the audio
+        forwarded (bool): Whether this is forwarded audio
+        audio_bytes (bytes | None): Encoded audio already in memory; used instead of audio_path
+
+    Returns:
+        dict: The audio payload to be sent, with the WAV audio base64-encoded
+    """
+    payload, wav_bytes = prepare_audio_frames(
+        audio_path,
+        chunk_length_ms=chunk_length_ms,
+        display_text=display_text,
+        actions=actions,
+        forwarded=forwarded,
+        audio_bytes=audio_bytes,
+    )
+    if wav_bytes is not None:
+        payload["audio"] = base64.b64encode(wav_bytes).decode(
+            "utf-8"
+        )
     return payload